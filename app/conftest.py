@@ -1,6 +1,6 @@
 import os
-import tempfile
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Generator
+from pathlib import Path
 
 import pytest
 import pytest_asyncio
@@ -13,37 +13,52 @@ from main import app
 from state import DatabaseService
 
 
-@pytest.fixture
-def container() -> AsyncGenerator[Container, None]:
-    """A fixture that sets up a container for testing."""
-    fd, path = tempfile.mkstemp(suffix=".json")
-    os.close(fd)
+@pytest.fixture(scope="session")
+def wired_container() -> Generator[Container, None, None]:
+    """A fixture that wires a container into the app once per test session."""
+    container = Container()
+    container.wire(modules=["main"])
+    app.container = container
+    yield container
+    container.unwire()
+
+
+@pytest.fixture(scope="session")
+def db_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """A fixture that provides the database file path for the test session."""
+    return tmp_path_factory.mktemp("db") / "db.sqlite3"
+
+
+@pytest.fixture(scope="session")
+def session_db_service(db_path: Path) -> Generator[DatabaseService, None, None]:
+    """A fixture that opens the test database once per test session."""
+    db_service = DatabaseService(db_file=str(db_path))
+    yield db_service
+    db_service.close()
 
+
+@pytest.fixture
+def container(
+    wired_container: Container, session_db_service: DatabaseService
+) -> Generator[Container, None, None]:
+    """A fixture that sets up the container's services for a single test."""
     github_token = os.getenv("GITHUB_TOKEN")
+    session_db_service.clear()
 
-    container = Container(
-        db_service=providers.Singleton(
-            DatabaseService,
-            db_file=path,
+    with (
+        wired_container.db_service.override(providers.Object(session_db_service)),
+        wired_container.github_service.override(
+            providers.Singleton(GithubService, github_token=github_token)
         ),
-        github_service=providers.Singleton(
-            GithubService,
-            github_token=github_token,
-        ),
-    )
-
-    yield container
-    container.db_service().close()
-    os.remove(path)
+    ):
+        yield wired_container
 
 
 @pytest_asyncio.fixture
-async def client(container: Container) -> AsyncClient:
+async def client(container: Container) -> AsyncGenerator[AsyncClient, None]:
     """A fixture that provides an httpx.AsyncClient for testing an ASGI application."""
-    container.wire(modules=["main"])
-    app.container = container
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as c:
         yield c
-    container.unwire()
+    await container.github_service().aclose()
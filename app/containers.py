@@ -1,9 +1,20 @@
+from collections.abc import AsyncIterator
+
 from dependency_injector import containers, providers
 
 from github_utils import GithubService
 from state import DatabaseService
 
 
+async def _github_service(github_token: str) -> AsyncIterator[GithubService]:
+    """Provides the Github service and closes its connections on shutdown."""
+    github_service = GithubService(github_token=github_token)
+    try:
+        yield github_service
+    finally:
+        await github_service.aclose()
+
+
 class Container(containers.DeclarativeContainer):
     """A container for the application's dependencies."""
 
@@ -12,8 +23,10 @@ class Container(containers.DeclarativeContainer):
     db_service = providers.Singleton(
         DatabaseService,
         db_file=config.db_file,
+        tinydb_file=config.tinydb_file,
     )
 
-    github_service = providers.Singleton(
-        GithubService, github_token=config.github_token
+    # Created on first use, shutdown only closes a service that was created.
+    github_service = providers.Resource(
+        _github_service, github_token=config.github_token
     )
@@ -1,13 +1,123 @@
 # Authentication is defined via github.Auth
+import asyncio
+import functools
 import logging
 import re
+import time
+from typing import Any
 
-from github import Auth, Github
+import httpx
+from github import Auth, Github, GithubRetry
 
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+
+# How long a checks result is reused before Github is asked again. Failures
+# expire sooner so a commit whose checks turn green is picked up promptly.
+CHECKS_PASSED_TTL = 30.0
+CHECKS_FAILED_TTL = 10.0
+CHECKS_CACHE_MAXSIZE = 4096
+
+# GraphQL requests get PyGithub's timeout. Server errors, and rate limits that
+# say when to retry, are retried with exponential backoff like GithubRetry,
+# unless Github asks to wait longer than GITHUB_RETRY_MAX_WAIT.
+GITHUB_TIMEOUT = 15.0
+GITHUB_MAX_RETRIES = 3
+GITHUB_RETRY_BACKOFF = 0.3
+GITHUB_RETRY_MAX_WAIT = 10.0
+
+# The health endpoint is probed frequently, the rate limit is only refreshed
+# from Github once this many seconds have passed.
+RATE_LIMIT_TTL = 5.0
+
+ChecksCacheKey = tuple[str, str, tuple[str, ...]]
+
+CHECK_RUNS_QUERY = """
+query($owner: String!, $name: String!, $sha: GitObjectID!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    object(oid: $sha) {
+      ... on Commit {
+        checkSuites(first: 100, after: $cursor) {
+          nodes {
+            id
+            checkRuns(first: 100, filterBy: {checkType: LATEST}) {
+              nodes { name status conclusion }
+              pageInfo { hasNextPage endCursor }
+            }
+          }
+          pageInfo { hasNextPage endCursor }
+        }
+      }
+    }
+  }
+}
+"""
+
+CHECK_SUITE_RUNS_QUERY = """
+query($id: ID!, $cursor: String!) {
+  node(id: $id) {
+    ... on CheckSuite {
+      checkRuns(first: 100, after: $cursor, filterBy: {checkType: LATEST}) {
+        nodes { name status conclusion }
+        pageInfo { hasNextPage endCursor }
+      }
+    }
+  }
+}
+"""
 
-logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=256)
+def _compile(pattern: str) -> re.Pattern[str]:
+    """Compiles a check regex once and reuses it across polls."""
+    return re.compile(pattern)
+
+
+@functools.cache
+def _github_client(github_token: str) -> Github:
+    """Returns the PyGithub client for a token, shared by every GithubService."""
+    return Github(
+        auth=Auth.Token(github_token),
+        retry=GithubRetry(total=3, backoff_factor=0.3),
+        pool_size=20,
+    )
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float | None:
+    """Returns how long to wait before retrying a response, None if it is final."""
+    if attempt >= GITHUB_MAX_RETRIES:
+        return None
+
+    if response.is_server_error:
+        return GITHUB_RETRY_BACKOFF * 2**attempt
+
+    retry_after = response.headers.get("retry-after")
+    if response.status_code in (403, 429) and retry_after is not None:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            return None
+        return delay if delay <= GITHUB_RETRY_MAX_WAIT else None
+
+    return None
+
+
+def _check_run_succeeded(check_run: dict[str, Any]) -> bool:
+    """Returns whether a check run completed successfully."""
+    return check_run["status"] == "COMPLETED" and check_run["conclusion"] == "SUCCESS"
+
+
+def _has_failed_check_run(
+    check_runs: list[dict[str, Any]], checks_regex: list[str]
+) -> bool:
+    """Returns whether any check run matching the regexes did not succeed."""
+    patterns = [_compile(check_regex) for check_regex in checks_regex]
+    return any(
+        not _check_run_succeeded(check_run)
+        for check_run in check_runs
+        if any(pattern.match(check_run["name"]) for pattern in patterns)
+    )
 
 
 class GithubService:
@@ -15,56 +125,241 @@ class GithubService:
 
     def __init__(self, github_token: str) -> None:
         """Initializes the GithubService."""
-        auth = Auth.Token(github_token)
-        self._github_client = Github(auth=auth)
+        self._github_client = _github_client(github_token)
+        self._http_client = httpx.AsyncClient(
+            base_url=GITHUB_API_URL,
+            headers={
+                "Authorization": f"bearer {github_token}",
+                "Accept": "application/vnd.github+json",
+            },
+            timeout=GITHUB_TIMEOUT,
+            # No custom transport, httpx then mounts the HTTPS_PROXY and
+            # NO_PROXY settings from the environment like PyGithub does.
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        )
+        self._checks_cache: dict[ChecksCacheKey, tuple[float, bool]] = {}
+        self._checks_locks: dict[ChecksCacheKey, asyncio.Lock] = {}
+        self._rate_limit_remaining: tuple[float, int] | None = None
+
+    async def _get_rate_limit_remaining(self) -> int:
+        """Returns the remaining GraphQL rate limit, refreshed at most every TTL."""
+        now = time.monotonic()
+        if self._rate_limit_remaining is None or self._rate_limit_remaining[0] <= now:
+            rate_limit = await asyncio.to_thread(self._github_client.get_rate_limit)
+            # Checks are queried with GraphQL, which has its own budget.
+            remaining = rate_limit.resources.graphql.remaining
+            self._rate_limit_remaining = (now + RATE_LIMIT_TTL, remaining)
+
+        return self._rate_limit_remaining[1]
 
     async def health_check(self) -> bool:
         """Checks if the Github service is healthy."""
         try:
-            rate = self._github_client.get_rate_limit()
+            remaining = await self._get_rate_limit_remaining()
 
-            if rate.rate.remaining < 1:
-                logger.error(
-                    f"Github rate limit is reached, remaining: {rate.rate.remaining}"
-                )
+            if remaining < 1:
+                logger.error("Github rate limit is reached, remaining: %d", remaining)
                 return False
-            logger.debug(f"Github rate limit: {self._github_client.get_rate_limit()}")
+            logger.debug("Github rate limit remaining: %d", remaining)
             return True
         except Exception as e:
-            logger.error(f"Github service is not healthy: {e}")
+            logger.error("Github service is not healthy: %s", e)
             return False
 
-    def commit_passed_checks(
+    async def aclose(self) -> None:
+        """Closes the pooled HTTP connections to Github."""
+        await self._http_client.aclose()
+
+    async def _gql(self, query: str, variables: dict[str, Any]) -> dict[str, Any]:
+        """Runs a query against the Github GraphQL API and returns its data."""
+        for attempt in range(GITHUB_MAX_RETRIES + 1):
+            try:
+                response = await self._http_client.post(
+                    "/graphql", json={"query": query, "variables": variables}
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt >= GITHUB_MAX_RETRIES:
+                    raise
+                delay = GITHUB_RETRY_BACKOFF * 2**attempt
+                logger.warning(
+                    "Github GraphQL request could not connect: %s, retrying in %.1fs",
+                    e,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            delay = _retry_delay(response, attempt)
+            if delay is None:
+                break
+
+            logger.warning(
+                "Github GraphQL request failed with status %d, retrying in %.1fs",
+                response.status_code,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+        response.raise_for_status()
+
+        payload = response.json()
+        if payload.get("errors"):
+            raise Exception(f"Github GraphQL query failed: {payload['errors']}")
+
+        return payload["data"]
+
+    async def _get_check_runs(
+        self, repo: str, commit_sha: str
+    ) -> tuple[list[dict[str, Any]], list[tuple[str, str]]]:
+        """Returns the first check runs page and the (id, cursor) of longer suites."""
+        owner, name = repo.split("/", 1)
+        check_runs = []
+        truncated_suites = []
+        cursor = None
+        while True:
+            data = await self._gql(
+                CHECK_RUNS_QUERY,
+                {"owner": owner, "name": name, "sha": commit_sha, "cursor": cursor},
+            )
+
+            commit = (data["repository"] or {}).get("object")
+            if commit is None:
+                raise Exception(f"Commit {commit_sha} not found in {repo}")
+
+            for check_suite in commit["checkSuites"]["nodes"]:
+                page = check_suite["checkRuns"]
+                check_runs.extend(page["nodes"])
+                if page["pageInfo"]["hasNextPage"]:
+                    truncated_suites.append(
+                        (check_suite["id"], page["pageInfo"]["endCursor"])
+                    )
+
+            suites_page_info = commit["checkSuites"]["pageInfo"]
+            if not suites_page_info["hasNextPage"]:
+                return check_runs, truncated_suites
+            cursor = suites_page_info["endCursor"]
+
+    async def _get_remaining_suite_check_runs(
+        self, suite_id: str, cursor: str
+    ) -> list[dict[str, Any]]:
+        """Fetches the check runs of a check suite that follow the given cursor."""
+        check_runs = []
+        while True:
+            data = await self._gql(
+                CHECK_SUITE_RUNS_QUERY, {"id": suite_id, "cursor": cursor}
+            )
+            page = data["node"]["checkRuns"]
+            check_runs.extend(page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                return check_runs
+            cursor = page["pageInfo"]["endCursor"]
+
+    def _get_cached_checks(self, key: ChecksCacheKey) -> bool | None:
+        """Returns the cached checks result for the key if it has not expired."""
+        entry = self._checks_cache.get(key)
+        if entry is None:
+            return None
+
+        expires_at, passed = entry
+        if expires_at <= time.monotonic():
+            del self._checks_cache[key]
+            return None
+
+        return passed
+
+    def _cache_checks(self, key: ChecksCacheKey, passed: bool) -> None:
+        """Caches a checks result, evicting expired or oldest entries when full."""
+        now = time.monotonic()
+
+        if len(self._checks_cache) >= CHECKS_CACHE_MAXSIZE:
+            for expired in [k for k, v in self._checks_cache.items() if v[0] <= now]:
+                del self._checks_cache[expired]
+        if len(self._checks_cache) >= CHECKS_CACHE_MAXSIZE:
+            del self._checks_cache[next(iter(self._checks_cache))]
+
+        ttl = CHECKS_PASSED_TTL if passed else CHECKS_FAILED_TTL
+        self._checks_cache[key] = (now + ttl, passed)
+
+    async def commit_passed_checks(
         self,
         checks_regex: list[str],
         repo: str,
         commit_sha: str,
     ) -> bool:
         """Checks if the commit passed all the specified checks."""
-        commit = self._github_client.get_repo(repo).get_commit(commit_sha)
+        key = (repo, commit_sha, tuple(checks_regex))
 
-        for check_regex in checks_regex:
-            logger.info(f'Validating CI Check for regex "{check_regex}"')
+        passed = self._get_cached_checks(key)
+        if passed is not None:
+            logger.debug("CACHE HIT: checks result for %s@%s", repo, commit_sha)
+            return passed
+
+        # Concurrent calls for the same commit and checks share one request.
+        lock = self._checks_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                passed = self._get_cached_checks(key)
+                if passed is None:
+                    passed = await self._validate_checks(checks_regex, repo, commit_sha)
+                    self._cache_checks(key, passed)
+                return passed
+        finally:
+            if self._checks_locks.get(key) is lock and not lock.locked():
+                del self._checks_locks[key]
+
+    async def _validate_checks(
+        self,
+        checks_regex: list[str],
+        repo: str,
+        commit_sha: str,
+    ) -> bool:
+        """Validates the commit's check runs against the specified checks."""
+        check_runs, truncated_suites = await self._get_check_runs(repo, commit_sha)
 
-            matched_runs = [
-                i for i in commit.get_check_runs() if re.match(check_regex, i.name)
-            ]
+        # A failure in the first page already decides the result, otherwise the
+        # remaining pages of every truncated suite are fetched concurrently.
+        if truncated_suites and not _has_failed_check_run(check_runs, checks_regex):
+            pages = await asyncio.gather(
+                *[
+                    self._get_remaining_suite_check_runs(suite_id, cursor)
+                    for suite_id, cursor in truncated_suites
+                ]
+            )
+            for page in pages:
+                check_runs.extend(page)
 
-            if len(matched_runs) == 0:
-                logger.info(f'No CI check run found for regex "{check_regex}"')
+        patterns = [
+            (check_regex, _compile(check_regex)) for check_regex in checks_regex
+        ]
+        matched_regexes = set()
+
+        # Single pass over the runs: every run is tested against every regex and
+        # the first matching run that did not succeed fails the whole commit.
+        for check_run in check_runs:
+            for check_regex, pattern in patterns:
+                if not pattern.match(check_run["name"]):
+                    continue
 
-            for check_run in matched_runs:
                 logger.info(
-                    f'CI Check "{check_run.name}" matched "{check_regex}", validating...'  # noqa: E501
+                    'CI Check "%s" matched "%s", validating...',
+                    check_run["name"],
+                    check_regex,
                 )
-                if not (
-                    check_run.status == "completed"
-                    and check_run.conclusion == "success"
-                ):
+                if not _check_run_succeeded(check_run):
                     logger.info(
-                        f'CI Check "{check_run.name}" failed with conclusion "{check_run.conclusion}" and status "{check_run.status}" on regex "{check_regex}"'  # noqa: E501
+                        'CI Check "%s" failed with conclusion "%s" and status "%s" on regex "%s"',  # noqa: E501
+                        check_run["name"],
+                        check_run["conclusion"],
+                        check_run["status"],
+                        check_regex,
                     )
                     return False
-            logger.info(f'CI Check for regex "{check_regex}" passed')
+                matched_regexes.add(check_regex)
+
+        for check_regex in checks_regex:
+            if check_regex in matched_regexes:
+                logger.info('CI Check for regex "%s" passed', check_regex)
+            else:
+                logger.info('No CI check run found for regex "%s"', check_regex)
 
         return True
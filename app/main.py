@@ -1,21 +1,34 @@
 import asyncio
+import functools
+import hashlib
 import logging
 import os
-from contextlib import asynccontextmanager
+import queue
+from collections.abc import Iterator
+from contextlib import asynccontextmanager, contextmanager, suppress
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, Literal
 
 from dependency_injector.wiring import Provide, inject
 from fastapi import Depends, FastAPI
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel, ConfigDict, model_validator
+from pydantic import BaseModel, ConfigDict, TypeAdapter, model_validator
+from pydantic_core import to_json
 
 from containers import Container
 from github_utils import GithubService
 from state import DatabaseService
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_DB_FILE = "db.sqlite3"
+# The default DB_FILE of releases that stored applications with TinyDB.
+DEFAULT_TINYDB_FILE = "db.json"
+
+GITHUB_HTTPS_PREFIX = "https://github.com/"
+GITHUB_SSH_PREFIX = "git@github.com:"
+
 
 class ParamsScmData(BaseModel):
     """Parameters schema for the ArgoCD getparams request."""
@@ -39,6 +52,11 @@ class ParamsPrData(BaseModel):
     model_config = ConfigDict(extra="allow")
 
 
+# Built once at import time and reused for every request.
+_scm_data_adapter = TypeAdapter(ParamsScmData)
+_pr_data_adapter = TypeAdapter(ParamsPrData)
+
+
 class Params(BaseModel):
     """Parameters schema for the ArgoCD getparams request."""
 
@@ -58,11 +76,9 @@ class Params(BaseModel):
         data_field = data.get("data")
 
         if generator_type == "scm":
-            validated_data = ParamsScmData.model_validate(data_field)
-            data["data"] = validated_data.model_dump()
+            data["data"] = _scm_data_adapter.validate_python(data_field)
         elif generator_type == "pr":
-            validated_data = ParamsPrData.model_validate(data_field)
-            data["data"] = validated_data.model_dump()
+            data["data"] = _pr_data_adapter.validate_python(data_field)
 
         return data
 
@@ -86,77 +102,149 @@ class GetParamsResponse(BaseModel):
     output: dict[str, Any]
 
 
+@functools.lru_cache(maxsize=1024)
+def _parse_repo_url(repo_url: str) -> tuple[str, str]:
+    """Returns the organization and repository name of a https or ssh Github URL."""
+    url = repo_url.removesuffix(".git")
+    if url.startswith(GITHUB_HTTPS_PREFIX):
+        path = url[len(GITHUB_HTTPS_PREFIX) :]
+    else:
+        path = url.removeprefix(GITHUB_SSH_PREFIX)
+
+    organization, _, repository = path.partition("/")
+    return organization, repository
+
+
+def _checks_fingerprint(sha: str, checks_regex: list[str]) -> str:
+    """Returns a fixed width fingerprint of a commit and the checks it passed."""
+    data = b"\x00".join(s.encode() for s in [sha, *checks_regex])
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PydanticJSONResponse(JSONResponse):
+    """JSON response encoded by pydantic-core instead of the stdlib json module."""
+
+    def render(self, content: Any) -> bytes:  # noqa: ANN401
+        """Encodes the content to JSON bytes."""
+        return to_json(content)
+
+
+def _params_response(parameters: list[dict[str, Any]]) -> PydanticJSONResponse:
+    """Builds the getparams response without validating it again."""
+    return PydanticJSONResponse(
+        GetParamsResponse.model_construct(output={"parameters": parameters})
+    )
+
+
+class _LocalQueueHandler(QueueHandler):
+    """Enqueues records unformatted, for a listener in the same process."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Returns the record as is, the listener's handlers format it."""
+        return record
+
+
+@contextmanager
+def _queue_logging() -> Iterator[None]:
+    """Moves the root logger's handlers onto a background listener thread."""
+    root = logging.getLogger()
+    handlers = root.handlers
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root.handlers = [_LocalQueueHandler(log_queue)]
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        root.handlers = handlers
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):  # noqa: ANN201 TODO
     """Initializes the container and sets up the database connection."""
-    container = Container()
-    db_file = os.getenv("DB_FILE", "db.json")
-    github_token = os.getenv("GITHUB_TOKEN")
-    container.config.from_dict({"db_file": db_file, "github_token": github_token})
-    container.wire(modules=[__name__])
-    _app.container = container
-    yield
-    container.unwire()
+    with _queue_logging():
+        container = Container()
+        db_file = os.getenv("DB_FILE")
+        github_token = os.getenv("GITHUB_TOKEN")
+        container.config.from_dict(
+            {
+                "db_file": db_file or DEFAULT_DB_FILE,
+                "tinydb_file": None if db_file else DEFAULT_TINYDB_FILE,
+                "github_token": github_token,
+            }
+        )
+        container.wire(modules=[__name__])
+        _app.container = container
+
+        db_service = container.db_service()
+        writer = asyncio.create_task(db_service.run_writer())
+        try:
+            yield
+        finally:
+            writer.cancel()
+            with suppress(asyncio.CancelledError):
+                await writer
+            try:
+                db_service.close()
+            finally:
+                if container.github_service.initialized:
+                    await container.github_service.shutdown()
+                container.unwire()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=PydanticJSONResponse)
 
 
-@app.post("/api/v1/getparams.execute")
+@app.post("/api/v1/getparams.execute", response_model=GetParamsResponse)
 @inject
 async def process_argocd_param(
     request: GetParamsRequest,
     db_service: DatabaseService = Depends(Provide[Container.db_service]),  # noqa: B008 TODO
     github_service: GithubService = Depends(Provide[Container.github_service]),  # noqa: B008 TODO
-) -> GetParamsResponse:
+) -> PydanticJSONResponse:
     """Processes the ArgoCD getparams request."""
     application_set_name = request.applicationSetName
 
     checks_regex: list[str] = request.input.parameters.checks_regex
+    d = request.input.parameters.data
 
-    if request.input.parameters.sourceGeneratorType == "scm":
-        d = ParamsScmData.model_validate(request.input.parameters.data)
-        organization = d.organization
-        repository: str = d.repository
-        branch: str = d.branch
-        sha: str = d.sha
-        state = d.model_dump()
+    match request.input.parameters.sourceGeneratorType:
+        case "scm":
+            organization = d.organization
+            repository: str = d.repository
+            sha: str = d.sha
+        case "pr":
+            organization, repository = _parse_repo_url(d.repoURL)
+            sha = d.head_sha
 
-    if request.input.parameters.sourceGeneratorType == "pr":
-        d = ParamsPrData.model_validate(request.input.parameters.data)
+    branch: str = d.branch
+    state = d.model_dump()
 
-        if d.repoURL.startswith("https://github.com/"):
-            organization = d.repoURL.split("/")[-2]
-            repository = d.repoURL.split("/")[-1].removesuffix(".git")
-        else:
-            organization = d.repoURL.removeprefix("git@github.com:").split("/")[0]
-            repository = d.repoURL.split("/")[-1].removesuffix(".git")
+    sha_check_fingerprint = _checks_fingerprint(sha, checks_regex)
 
-        branch: str = d.branch
-        sha: str = d.head_sha
-
-        state = d.model_dump()
-
-    sha_check_fingerprint = "+".join([sha, *checks_regex])
-
-    application_data = db_service.get_application(
+    application_data = await db_service.get_application(
         application_set_name, repository, branch
     )
 
-    logger.debug(f"Application data: {application_data}")
+    logger.debug("Application data: %s", application_data)
 
     if (
         application_data is not None
         and application_data["last_known_good_sha"] == sha_check_fingerprint
     ):
         logger.debug(
-            f"CACHE HIT: Application found for {application_set_name}, {repository}, {branch} with last known good sha {sha_check_fingerprint} matching current SHA"  # noqa: E501
+            "CACHE HIT: Application found for %s, %s, %s with last known good sha %s matching current SHA",  # noqa: E501
+            application_set_name,
+            repository,
+            branch,
+            sha_check_fingerprint,
         )
 
-        resp = {"output": {"parameters": [state]}}
-        return GetParamsResponse(**resp)
+        return _params_response([state])
 
-    checks_result = github_service.commit_passed_checks(
+    checks_result = await github_service.commit_passed_checks(
         checks_regex=checks_regex,
         repo=f"{organization}/{repository}",
         commit_sha=sha,
@@ -165,50 +253,56 @@ async def process_argocd_param(
     if checks_result:
         if application_data is None:
             logger.info(
-                f"Application not found for {application_set_name}, {repository}, {branch}"  # noqa: E501
-            )
-            logger.info(
-                f"Creating new application with last known good sha {sha_check_fingerprint}"  # noqa: E501
-            )
-            db_service.create_application(
+                "Application not found for %s, %s, %s",
                 application_set_name,
                 repository,
                 branch,
-                state,
-                last_known_good_sha=sha_check_fingerprint,
             )
-            logger.info("Application created")
-
-        else:
             logger.info(
-                f"Application found for {application_set_name}, {repository}, {branch}"
+                "Creating new application with last known good sha %s",
+                sha_check_fingerprint,
             )
+
+        else:
             logger.info(
-                f"Updating application with last known good sha {sha_check_fingerprint}"
-            )
-            db_service.update_application(
+                "Application found for %s, %s, %s",
                 application_set_name,
                 repository,
                 branch,
-                state,
-                last_known_good_sha=sha_check_fingerprint,
             )
-        resp = {"output": {"parameters": [state]}}
-        return GetParamsResponse(**resp)
+            logger.info(
+                "Updating application with last known good sha %s",
+                sha_check_fingerprint,
+            )
+
+        await db_service.upsert_application(
+            application_set_name,
+            repository,
+            branch,
+            state,
+            last_known_good_sha=sha_check_fingerprint,
+        )
+        return _params_response([state])
 
     else:
         if application_data is None:
             logger.info(
-                f"GH checks on {repository} failed, no application found for {application_set_name}, {repository}, {branch}, and no application is found, returning empty state"  # noqa: E501
+                "GH checks on %s failed, no application found for %s, %s, %s, and no application is found, returning empty state",  # noqa: E501
+                repository,
+                application_set_name,
+                repository,
+                branch,
             )
-            return GetParamsResponse(**{"output": {"parameters": []}})
+            return _params_response([])
         else:
             logger.info(
-                f"GH checks on {repository} failed, application found for {application_set_name}, {repository}, {branch}, returning previous state"  # noqa: E501
-            )
-            return GetParamsResponse(
-                **{"output": {"parameters": [application_data["state"]]}}
+                "GH checks on %s failed, application found for %s, %s, %s, returning previous state",  # noqa: E501
+                repository,
+                application_set_name,
+                repository,
+                branch,
             )
+            return _params_response([application_data["state"]])
 
 
 @app.get("/health")
@@ -216,7 +310,7 @@ async def process_argocd_param(
 async def health_check(
     db_service: DatabaseService = Depends(Provide[Container.db_service]),  # noqa: B008 TODO
     github_service: GithubService = Depends(Provide[Container.github_service]),  # noqa: B008 TODO
-) -> JSONResponse:
+) -> PydanticJSONResponse:
     """Health check endpoint."""
     db_healthy, github_healthy = await asyncio.gather(
         db_service.health_check(), github_service.health_check()
@@ -231,4 +325,4 @@ async def health_check(
 
     status_code = 200 if overall_status else 503
 
-    return JSONResponse(content=health_status, status_code=status_code)
+    return PydanticJSONResponse(content=health_status, status_code=status_code)
@@ -1,126 +1,385 @@
+import asyncio
 import logging
-import uuid
+import os
+import shutil
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import suppress
+from types import MappingProxyType
 from typing import Any
 
-from tinydb import Query, TinyDB
+from pydantic_core import from_json, to_json
 
 logger = logging.getLogger(__name__)
 
+ApplicationKey = tuple[str, str, str]
+
+# Writes are buffered and committed together, either on the next flush
+# interval or as soon as this many distinct applications are pending.
+WRITE_FLUSH_INTERVAL = 0.05
+WRITE_BATCH_SIZE = 64
+
+# Least recently used applications are evicted from the read cache beyond
+# this many entries.
+APPLICATION_CACHE_MAXSIZE = 4096
+
+# Every SQLite database file starts with this header. Any other non-empty file
+# is expected to be the TinyDB JSON file used by earlier releases.
+SQLITE_HEADER = b"SQLite format 3\x00"
+TINYDB_IMPORTED_SUFFIX = ".imported"
+TINYDB_IMPORTING_SUFFIX = ".importing"
+
+CREATE_APPLICATION_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS application (
+    id INTEGER PRIMARY KEY,
+    application_set_name TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_known_good_sha TEXT,
+    UNIQUE (application_set_name, repo, branch)
+)
+"""
+
+SELECT_APPLICATION_QUERY = """
+SELECT application_set_name, repo, branch, state, last_known_good_sha
+FROM application
+WHERE application_set_name = ? AND repo = ? AND branch = ?
+"""
+
+UPSERT_APPLICATION_QUERY = """
+INSERT INTO application
+    (application_set_name, repo, branch, state, last_known_good_sha)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (application_set_name, repo, branch) DO UPDATE SET
+    state = excluded.state,
+    last_known_good_sha = excluded.last_known_good_sha
+"""
+
+
+def _is_sqlite_file(db_file: str) -> bool:
+    """Returns whether the file is missing, empty or a SQLite database."""
+    try:
+        with open(db_file, "rb") as f:
+            header = f.read(len(SQLITE_HEADER))
+    except FileNotFoundError:
+        return True
+
+    return not header or header == SQLITE_HEADER
+
+
+def _read_tinydb_applications(
+    tinydb_file: str,
+) -> list[tuple[ApplicationKey, dict[str, Any], str | None]]:
+    """Returns the (key, state, last known good sha) of every TinyDB application."""
+    with open(tinydb_file, "rb") as f:
+        data = f.read()
+    # TinyDB creates an empty file when opened and only writes to it later.
+    if not data:
+        return []
+
+    try:
+        tables = from_json(data)
+        return [
+            (
+                (a["application_set_name"], a["repo"], a["branch"]),
+                a["state"],
+                a.get("last_known_good_sha"),
+            )
+            for a in tables.get("application", {}).values()
+        ]
+    except (ValueError, AttributeError, KeyError, TypeError) as e:
+        raise Exception(
+            f"{tinydb_file} is neither a SQLite database nor a valid TinyDB JSON file"
+        ) from e
+
+
+def _import_tinydb_file(tinydb_file: str, db_file: str) -> None:
+    """Imports a TinyDB JSON file into a new SQLite database at db_file.
+
+    Nothing is moved until every application is committed to a temporary
+    database, which then replaces db_file. The TinyDB file is renamed last.
+    """
+    applications = _read_tinydb_applications(tinydb_file)
+
+    import_file = db_file + TINYDB_IMPORTING_SUFFIX
+    for stale_file in (import_file, import_file + "-journal"):
+        with suppress(FileNotFoundError):
+            os.remove(stale_file)
+
+    conn = sqlite3.connect(import_file)
+    try:
+        conn.execute(CREATE_APPLICATION_TABLE_QUERY)
+        with conn:
+            conn.executemany(
+                UPSERT_APPLICATION_QUERY,
+                [
+                    (*key, to_json(state).decode(), last_known_good_sha)
+                    for key, state, last_known_good_sha in applications
+                ],
+            )
+    finally:
+        conn.close()
+
+    if tinydb_file == db_file:
+        # Kept as a copy, db_file still holds it until it is replaced.
+        shutil.copyfile(tinydb_file, tinydb_file + TINYDB_IMPORTED_SUFFIX)
+        os.replace(import_file, db_file)
+    else:
+        os.replace(import_file, db_file)
+        os.replace(tinydb_file, tinydb_file + TINYDB_IMPORTED_SUFFIX)
+
+    logger.info("Imported %d applications from %s", len(applications), tinydb_file)
+
 
 class DatabaseService:
-    """A service to interact with the TinyDB database."""
+    """A service to interact with the SQLite database."""
 
-    def __init__(self, db_file: str) -> None:
-        self._db = TinyDB(db_file, indent=4, sort_keys=True)
-        self._application_table = self._db.table("application")
+    __slots__ = ("_cache", "_conn", "_lock", "_pending")
 
-    async def health_check(self) -> bool:
-        """Checks if the database is healthy."""
-        try:
-            health_check_id = str(uuid.uuid4())
-            test_record = {"type": "health_check", "id": health_check_id}
+    def __init__(self, db_file: str, tinydb_file: str | None = None) -> None:
+        # The TinyDB file of an earlier release is imported once. It is either
+        # db_file itself, or tinydb_file if db_file does not exist yet.
+        if not _is_sqlite_file(db_file):
+            _import_tinydb_file(db_file, db_file)
+        elif (
+            tinydb_file is not None
+            and os.path.exists(tinydb_file)
+            and not os.path.exists(db_file)
+        ):
+            _import_tinydb_file(tinydb_file, db_file)
+
+        self._conn = sqlite3.connect(
+            db_file, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL only syncs at checkpoints, a power loss can drop
+        # the last commits but never corrupts the database.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(CREATE_APPLICATION_TABLE_QUERY)
+        # LRU read cache of get_application, including misses, and the writes
+        # not committed yet, keyed by application. Later writes to the same
+        # application replace earlier ones, so a batch holds one row each.
+        # Pending writes are committed by flush, which run_writer calls.
+        self._cache: dict[ApplicationKey, Mapping[str, Any] | None] = {}
+        self._pending: dict[ApplicationKey, Mapping[str, Any]] = {}
+        self._lock = threading.Lock()
 
-            result = self._db.insert(test_record)
-            if result is None:
-                raise Exception("Could not insert test record into the database")
+    def _health_check(self) -> None:
+        """Blocking implementation of `health_check`."""
+        with self._lock:
+            self._conn.execute("SELECT 1 FROM application LIMIT 1").fetchall()
 
-            self._db.remove(Query().id == health_check_id)
+    async def health_check(self) -> bool:
+        """Checks if the database is healthy with a read-only query."""
+        try:
+            await asyncio.to_thread(self._health_check)
             return True
         except Exception as e:
-            logger.error(f"Database is not healthy: {e}")
+            logger.error("Database is not healthy: %s", e)
             return False
 
-    def create_application(
-        self,
-        application_set_name: str,
-        repo: str,
-        branch: str,
-        state: dict[str, Any],
-        last_known_good_sha: str | None = None,
-    ) -> int:
-        """Creates a new application entry in the database."""
-        application = Query()
-        items = self._application_table.search(
-            application.fragment(
-                {
-                    "application_set_name": application_set_name,
-                    "repo": repo,
-                    "branch": branch,
-                }
-            )
+    def _lookup_application(self, key: ApplicationKey) -> Mapping[str, Any] | None:
+        """Finds an application in the pending writes, cache or SQLite, lock held."""
+        if key in self._pending:
+            return self._pending[key]
+        if key in self._cache:
+            # Reinserting moves the entry to the end, the most recently used.
+            application = self._cache[key] = self._cache.pop(key)
+            return application
+
+        row = self._conn.execute(SELECT_APPLICATION_QUERY, key).fetchone()
+
+        application = (
+            None
+            if row is None
+            else MappingProxyType({**dict(row), "state": from_json(row["state"])})
         )
+        self._cache_application(key, application)
+        return application
 
-        if len(items) > 0:
-            raise Exception(
-                f"Application already exists for {application_set_name}, {repo}, {branch}"  # noqa: E501
-            )
+    def _cache_application(
+        self, key: ApplicationKey, application: Mapping[str, Any] | None
+    ) -> None:
+        """Caches an application, evicting the least recently used one, lock held."""
+        self._cache.pop(key, None)
+        # An evicted application that is still pending is read from _pending.
+        if len(self._cache) >= APPLICATION_CACHE_MAXSIZE:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = application
 
-        return self._application_table.insert(
+    def _write_application(
+        self,
+        key: ApplicationKey,
+        state: dict[str, Any],
+        last_known_good_sha: str | None,
+    ) -> None:
+        """Buffers an application write. Must be called with the lock held."""
+        application = MappingProxyType(
             {
-                "application_set_name": application_set_name,
-                "repo": repo,
-                "branch": branch,
+                "application_set_name": key[0],
+                "repo": key[1],
+                "branch": key[2],
                 "state": state,
                 "last_known_good_sha": last_known_good_sha,
             }
         )
+        self._pending[key] = application
+        self._cache_application(key, application)
 
-    def get_application(
+        if len(self._pending) >= WRITE_BATCH_SIZE:
+            self._flush()
+
+    def _create_application(
+        self,
+        key: ApplicationKey,
+        state: dict[str, Any],
+        last_known_good_sha: str | None,
+    ) -> None:
+        """Blocking implementation of `create_application`."""
+        with self._lock:
+            if self._lookup_application(key) is not None:
+                raise Exception(
+                    f"Application already exists for {key[0]}, {key[1]}, {key[2]}"
+                )
+
+            self._write_application(key, state, last_known_good_sha)
+
+    def _get_application(self, key: ApplicationKey) -> Mapping[str, Any] | None:
+        """Blocking implementation of `get_application`."""
+        with self._lock:
+            return self._lookup_application(key)
+
+    def _update_application(
+        self,
+        key: ApplicationKey,
+        state: dict[str, Any],
+        last_known_good_sha: str | None,
+    ) -> None:
+        """Blocking implementation of `update_application`."""
+        with self._lock:
+            if self._lookup_application(key) is None:
+                raise Exception(
+                    f"Application not found for {key[0]}, {key[1]}, {key[2]}"
+                )
+
+            self._write_application(key, state, last_known_good_sha)
+
+    def _upsert_application(
+        self,
+        key: ApplicationKey,
+        state: dict[str, Any],
+        last_known_good_sha: str | None,
+    ) -> None:
+        """Blocking implementation of `upsert_application`."""
+        with self._lock:
+            self._write_application(key, state, last_known_good_sha)
+
+    async def create_application(
+        self,
+        application_set_name: str,
+        repo: str,
+        branch: str,
+        state: dict[str, Any],
+        last_known_good_sha: str | None = None,
+    ) -> None:
+        """Creates a new application entry in the database."""
+        await asyncio.to_thread(
+            self._create_application,
+            (application_set_name, repo, branch),
+            state,
+            last_known_good_sha,
+        )
+
+    async def get_application(
         self, application_set_name: str, repo: str, branch: str
-    ) -> dict[str, Any] | None:
+    ) -> Mapping[str, Any] | None:
         """Retrieves the state of an existing application."""
-        application = Query()
-        items = self._application_table.search(
-            application.fragment(
-                {
-                    "application_set_name": application_set_name,
-                    "repo": repo,
-                    "branch": branch,
-                }
-            )
+        return await asyncio.to_thread(
+            self._get_application, (application_set_name, repo, branch)
         )
-        if len(items) == 0:
-            return None
-
-        if len(items) > 1:
-            raise Exception(
-                f"Multiple applications found for {application_set_name}, {repo}, {branch}"  # noqa: E501
-            )
-
-        return items[0]
 
-    def update_application(
+    async def update_application(
         self,
         application_set_name: str,
         repo: str,
         branch: str,
         state: dict[str, Any],
         last_known_good_sha: str | None = None,
-    ) -> int:
+    ) -> None:
         """Updates the state of an existing application."""
-        application = Query()
-        items = self._application_table.update(
-            {"state": state, "last_known_good_sha": last_known_good_sha},
-            application.fragment(
-                {
-                    "application_set_name": application_set_name,
-                    "repo": repo,
-                    "branch": branch,
-                }
-            ),
+        await asyncio.to_thread(
+            self._update_application,
+            (application_set_name, repo, branch),
+            state,
+            last_known_good_sha,
         )
 
-        if len(items) == 0:
-            raise Exception(
-                f"Application not found for {application_set_name}, {repo}, {branch}"
-            )
-        if len(items) > 1:
-            raise Exception(
-                f"Multiple applications found for {application_set_name}, {repo}, {branch}"  # noqa: E501
+    async def upsert_application(
+        self,
+        application_set_name: str,
+        repo: str,
+        branch: str,
+        state: dict[str, Any],
+        last_known_good_sha: str | None = None,
+    ) -> None:
+        """Creates the application entry, or updates it if it already exists."""
+        await asyncio.to_thread(
+            self._upsert_application,
+            (application_set_name, repo, branch),
+            state,
+            last_known_good_sha,
+        )
+
+    def _flush(self) -> None:
+        """Commits the pending writes. Must be called with the lock held."""
+        if not self._pending:
+            return
+
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                UPSERT_APPLICATION_QUERY,
+                [
+                    (*key, to_json(a["state"]).decode(), a["last_known_good_sha"])
+                    for key, a in self._pending.items()
+                ],
             )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        logger.debug("Committed %d application writes", len(self._pending))
+        self._pending.clear()
+
+    def flush(self) -> None:
+        """Commits the pending writes to the database in a single transaction."""
+        with self._lock:
+            self._flush()
+
+    async def run_writer(self, interval: float = WRITE_FLUSH_INTERVAL) -> None:
+        """Flushes the pending writes every interval until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            if not self._pending:
+                continue
+
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error("Could not commit pending application writes: %s", e)
 
-        return items[0]
+    def clear(self) -> None:
+        """Deletes all applications, including the pending writes."""
+        with self._lock:
+            self._pending.clear()
+            self._cache.clear()
+            self._conn.execute("DELETE FROM application")
 
     def close(self) -> None:
-        """Closes the database connection."""
-        self._db.close()
+        """Commits the pending writes and closes the database connection."""
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,408 @@
+# test_github_utils.py
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+import pytest
+import pytest_asyncio
+
+import github_utils
+from github_utils import GITHUB_API_URL, GithubService
+
+REPO = "test-org/test-repo"
+SHA = "de5e62e7eaf38691a62f806e16887b2620532594"
+
+Handler = Callable[[httpx.Request], Awaitable[httpx.Response]]
+
+
+@pytest_asyncio.fixture
+async def github_service() -> AsyncGenerator[GithubService, None]:
+    """A fixture that provides a GithubService that never reaches Github."""
+    service = GithubService(github_token="test-token")
+    yield service
+    await service.aclose()
+
+
+class FakeGithub:
+    """Serves queued GraphQL responses and records the queries it receives."""
+
+    def __init__(self, *responses: httpx.Response) -> None:
+        self.responses = list(responses)
+        self.queries: list[dict[str, Any]] = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        """Answers a request with the next queued response."""
+        self.queries.append(json.loads(request.content))
+        # Yields like a real request would, so concurrent callers interleave.
+        await asyncio.sleep(0)
+        return self.responses.pop(0)
+
+
+class FakeClock:
+    """A monotonic clock that only moves when advanced."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """Returns the current time."""
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    """A fixture that replaces the clock of the checks cache."""
+    fake_clock = FakeClock()
+    monkeypatch.setattr(github_utils, "time", fake_clock)
+    return fake_clock
+
+
+class FakeGithubClient:
+    """Reports a GraphQL rate limit and counts how often it was requested."""
+
+    def __init__(self, remaining: int) -> None:
+        self.remaining = remaining
+        self.calls = 0
+
+    def get_rate_limit(self) -> SimpleNamespace:
+        """Returns the rate limit overview, like PyGithub's get_rate_limit."""
+        self.calls += 1
+        graphql = SimpleNamespace(remaining=self.remaining)
+        return SimpleNamespace(resources=SimpleNamespace(graphql=graphql))
+
+
+def mock_github(service: GithubService, handler: Handler) -> None:
+    """Routes the service's Github API requests to the handler."""
+    service._http_client = httpx.AsyncClient(
+        base_url=GITHUB_API_URL, transport=httpx.MockTransport(handler)
+    )
+
+
+# --- Helper Functions ---
+
+
+def check_run(name: str, conclusion: str = "SUCCESS") -> dict[str, Any]:
+    """Builds a completed check run."""
+    return {"name": name, "status": "COMPLETED", "conclusion": conclusion}
+
+
+def check_runs_page(
+    check_runs: tuple[dict[str, Any], ...], end_cursor: str | None
+) -> dict[str, Any]:
+    """Builds a page of check runs, followed by another page if end_cursor is set."""
+    return {
+        "nodes": list(check_runs),
+        "pageInfo": {"hasNextPage": end_cursor is not None, "endCursor": end_cursor},
+    }
+
+
+def commit_response(
+    *check_runs: dict[str, Any],
+    end_cursor: str | None = None,
+    suite_id: str = "suite-1",
+    suites_end_cursor: str | None = None,
+) -> httpx.Response:
+    """Builds a CHECK_RUNS_QUERY response with a single check suite."""
+    check_suite = {
+        "id": suite_id,
+        "checkRuns": check_runs_page(check_runs, end_cursor),
+    }
+    check_suites = {
+        "nodes": [check_suite],
+        "pageInfo": {
+            "hasNextPage": suites_end_cursor is not None,
+            "endCursor": suites_end_cursor,
+        },
+    }
+    return httpx.Response(
+        200,
+        json={"data": {"repository": {"object": {"checkSuites": check_suites}}}},
+    )
+
+
+def suite_response(
+    *check_runs: dict[str, Any], end_cursor: str | None = None
+) -> httpx.Response:
+    """Builds a CHECK_SUITE_RUNS_QUERY response."""
+    return httpx.Response(
+        200,
+        json={"data": {"node": {"checkRuns": check_runs_page(check_runs, end_cursor)}}},
+    )
+
+
+# --- Tests ---
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "failure",
+    [
+        httpx.Response(502),
+        httpx.Response(403, headers={"retry-after": "0"}),
+        httpx.Response(429, headers={"retry-after": "0"}),
+    ],
+)
+async def test_gql_retries_transient_failures(
+    github_service: GithubService,
+    monkeypatch: pytest.MonkeyPatch,
+    failure: httpx.Response,
+) -> None:
+    """Tests that server errors and rate limits with retry-after are retried."""
+    monkeypatch.setattr(github_utils, "GITHUB_RETRY_BACKOFF", 0.0)
+    github = FakeGithub(failure, commit_response(check_run("build")))
+    mock_github(github_service, github)
+
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert len(github.queries) == 2
+
+
+@pytest.mark.asyncio
+async def test_gql_gives_up_after_max_retries(
+    github_service: GithubService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a persistent server error is raised after the last retry."""
+    monkeypatch.setattr(github_utils, "GITHUB_RETRY_BACKOFF", 0.0)
+    attempts = github_utils.GITHUB_MAX_RETRIES + 1
+    github = FakeGithub(*[httpx.Response(503) for _ in range(attempts)])
+    mock_github(github_service, github)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert len(github.queries) == attempts
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "failure",
+    [
+        httpx.Response(401),
+        httpx.Response(403),
+        httpx.Response(403, headers={"retry-after": "3600"}),
+    ],
+)
+async def test_gql_does_not_retry_final_failures(
+    github_service: GithubService, failure: httpx.Response
+) -> None:
+    """Tests that client errors and long retry-after waits are not retried."""
+    github = FakeGithub(failure)
+    mock_github(github_service, github)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert len(github.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_gql_retries_connect_errors(
+    github_service: GithubService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a request that could not connect is retried."""
+    monkeypatch.setattr(github_utils, "GITHUB_RETRY_BACKOFF", 0.0)
+    github = FakeGithub(commit_response(check_run("build")))
+    attempts = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return await github(request)
+
+    mock_github(github_service, handler)
+
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_http_client_uses_env_proxy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that GraphQL requests go through the HTTPS_PROXY of the environment."""
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+    service = GithubService(github_token="test-token")
+    try:
+        transport = service._http_client._transport_for_url(
+            httpx.URL(f"{GITHUB_API_URL}/graphql")
+        )
+        assert isinstance(transport, httpx.AsyncHTTPTransport)
+        assert transport._pool._proxy_url.host == b"proxy.internal"
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checks_share_one_request(
+    github_service: GithubService,
+) -> None:
+    """Tests that concurrent calls for the same commit query Github once."""
+    github = FakeGithub(commit_response(check_run("build")))
+    mock_github(github_service, github)
+
+    results = await asyncio.gather(
+        *[github_service.commit_passed_checks(["build"], REPO, SHA) for _ in range(10)]
+    )
+
+    assert results == [True] * 10
+    assert len(github.queries) == 1
+    assert github_service._checks_locks == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "conclusion, passed, ttl",
+    [
+        ("SUCCESS", True, github_utils.CHECKS_PASSED_TTL),
+        ("FAILURE", False, github_utils.CHECKS_FAILED_TTL),
+    ],
+)
+async def test_checks_result_expires_after_ttl(
+    github_service: GithubService,
+    clock: FakeClock,
+    conclusion: str,
+    passed: bool,
+    ttl: float,
+) -> None:
+    """Tests that passed and failed results are cached for their own TTL."""
+    github = FakeGithub(
+        commit_response(check_run("build", conclusion)),
+        commit_response(check_run("build", conclusion)),
+    )
+    mock_github(github_service, github)
+
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA) is passed
+
+    clock.now += ttl - 1
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA) is passed
+    assert len(github.queries) == 1
+
+    clock.now += 1
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA) is passed
+    assert len(github.queries) == 2
+    assert github_service._checks_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_full_checks_cache_evicts_expired_then_oldest(
+    github_service: GithubService,
+    clock: FakeClock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a full cache drops expired results before the oldest one."""
+    monkeypatch.setattr(github_utils, "CHECKS_CACHE_MAXSIZE", 2)
+    github = FakeGithub(
+        commit_response(check_run("build", "FAILURE")),
+        commit_response(check_run("build")),
+        commit_response(check_run("build")),
+        commit_response(check_run("build")),
+    )
+    mock_github(github_service, github)
+
+    await github_service.commit_passed_checks(["build"], REPO, "failed-sha")
+    await github_service.commit_passed_checks(["build"], REPO, "passed-sha")
+
+    # The failed result has expired, so it makes room for the new result.
+    clock.now += github_utils.CHECKS_FAILED_TTL
+    await github_service.commit_passed_checks(["build"], REPO, "new-sha")
+    assert [key[1] for key in github_service._checks_cache] == [
+        "passed-sha",
+        "new-sha",
+    ]
+
+    # Nothing has expired, so the oldest result makes room instead.
+    await github_service.commit_passed_checks(["build"], REPO, "newest-sha")
+    assert [key[1] for key in github_service._checks_cache] == [
+        "new-sha",
+        "newest-sha",
+    ]
+    assert len(github.queries) == 4
+
+
+@pytest.mark.asyncio
+async def test_truncated_suite_pages_are_fetched(
+    github_service: GithubService,
+) -> None:
+    """Tests that every page of a truncated check suite is validated."""
+    github = FakeGithub(
+        commit_response(check_run("build-1"), end_cursor="cursor-1"),
+        suite_response(check_run("build-2"), end_cursor="cursor-2"),
+        suite_response(check_run("build-3")),
+    )
+    mock_github(github_service, github)
+
+    assert await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert [query["variables"] for query in github.queries[1:]] == [
+        {"id": "suite-1", "cursor": "cursor-1"},
+        {"id": "suite-1", "cursor": "cursor-2"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_check_suite_pages_are_fetched(
+    github_service: GithubService,
+) -> None:
+    """Tests that check runs of suites past the first suites page are validated."""
+    github = FakeGithub(
+        commit_response(check_run("build-1"), suites_end_cursor="suites-1"),
+        commit_response(
+            check_run("build-2", "FAILURE"), suite_id="suite-101", end_cursor="c-1"
+        ),
+    )
+    mock_github(github_service, github)
+
+    assert not await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert [query["variables"]["cursor"] for query in github.queries] == [
+        None,
+        "suites-1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failure_on_later_page_fails_checks(
+    github_service: GithubService,
+) -> None:
+    """Tests that a failed check run after the first page fails the commit."""
+    github = FakeGithub(
+        commit_response(check_run("build-1"), end_cursor="cursor-1"),
+        suite_response(check_run("build-2", "FAILURE")),
+    )
+    mock_github(github_service, github)
+
+    assert not await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert len(github.queries) == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_on_first_page_skips_remaining_pages(
+    github_service: GithubService,
+) -> None:
+    """Tests that a failure in the first page is decided without paginating."""
+    github = FakeGithub(
+        commit_response(check_run("build-1", "FAILURE"), end_cursor="cursor-1"),
+    )
+    mock_github(github_service, github)
+
+    assert not await github_service.commit_passed_checks(["build"], REPO, SHA)
+    assert len(github.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_health_check_reuses_rate_limit_within_ttl(
+    github_service: GithubService, clock: FakeClock
+) -> None:
+    """Tests that the GraphQL rate limit is only refreshed once its TTL expires."""
+    github_client = FakeGithubClient(remaining=1)
+    github_service._github_client = github_client
+
+    assert await github_service.health_check()
+    github_client.remaining = 0
+
+    clock.now += github_utils.RATE_LIMIT_TTL - 1
+    assert await github_service.health_check()
+    assert github_client.calls == 1
+
+    clock.now += 1
+    assert not await github_service.health_check()
+    assert github_client.calls == 2
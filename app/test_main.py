@@ -1,5 +1,7 @@
 # test_main.py
 
+import hashlib
+
 import pytest
 from httpx import AsyncClient
 
@@ -27,6 +29,16 @@ FAIL_SHA = "4f18d12c487449ef5120b3ed0ecba268edf5dbb8"
 PASSING_CHECKS_REGEX = ["pre-commit"]
 FAILING_CHECKS_REGEX = ["pre-commit"]
 
+DEFAULT_REPO_URL = f"https://github.com/{REPO_FULL_NAME}.git"
+
+# Generator data shared by every payload, build_payload adds the commit.
+SCM_DATA_TEMPLATE = {
+    "organization": REPO_ORG,
+    "repository": REPO_NAME,
+    "branch": BRANCH,
+}
+PR_DATA_TEMPLATE = {"branch": BRANCH}
+
 
 @pytest.fixture
 def db_service(container: Container) -> DatabaseService:
@@ -43,18 +55,11 @@ def build_payload(
     """Builds the ArgoCD request payload based on generator type and parameters."""
     data = {}
     if generator_type == "scm":
-        data = {
-            "organization": REPO_ORG,
-            "repository": REPO_NAME,
-            "branch": BRANCH,
-            "sha": sha,
-        }
+        data = {**SCM_DATA_TEMPLATE, "sha": sha}
     elif generator_type == "pr":
-        if repo_url is None:
-            repo_url = f"https://github.com/{REPO_FULL_NAME}.git"
         data = {
-            "repoURL": repo_url,
-            "branch": BRANCH,
+            **PR_DATA_TEMPLATE,
+            "repoURL": repo_url or DEFAULT_REPO_URL,
             "head_sha": sha,
         }
 
@@ -75,7 +80,7 @@ def build_payload(
 # Configurations for SCM, PR (HTTPS), and PR (Git) generators
 GENERATOR_CONFIGS = [
     ("scm", None),
-    ("pr", f"https://github.com/{REPO_FULL_NAME}.git"),
+    ("pr", DEFAULT_REPO_URL),
     ("pr", f"git@github.com:{REPO_FULL_NAME}.git"),
 ]
 
@@ -105,7 +110,7 @@ async def test_checks_pass_no_existing_app(
     sha_key = "sha" if generator_type == "scm" else "head_sha"
     assert data["output"]["parameters"][0][sha_key] == SUCCESS_SHA
 
-    db_app = db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
     assert db_app is not None
     assert db_app["state"][sha_key] == SUCCESS_SHA
 
@@ -129,7 +134,7 @@ async def test_checks_fail_no_existing_app(
     data = response.json()
     assert data["output"]["parameters"] == []
 
-    db_app = db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
     assert db_app is None
 
 
@@ -151,7 +156,7 @@ async def test_checks_fail_with_existing_app(
         sha_key: "old-sha",
     }
 
-    db_service.create_application(APP_SET_NAME, REPO_NAME, BRANCH, previous_state)
+    await db_service.create_application(APP_SET_NAME, REPO_NAME, BRANCH, previous_state)
 
     payload = build_payload(generator_type, FAIL_SHA, FAILING_CHECKS_REGEX, repo_url)
     response = await client.post("/api/v1/getparams.execute", json=payload)
@@ -176,7 +181,7 @@ async def test_checks_pass_with_existing_app_update(
     """
     sha_key = "sha" if generator_type == "scm" else "head_sha"
     previous_state = {"repository": REPO_NAME, sha_key: "old-sha"}
-    db_service.create_application(APP_SET_NAME, REPO_NAME, BRANCH, previous_state)
+    await db_service.create_application(APP_SET_NAME, REPO_NAME, BRANCH, previous_state)
 
     payload = build_payload(generator_type, SUCCESS_SHA, PASSING_CHECKS_REGEX, repo_url)
     response = await client.post("/api/v1/getparams.execute", json=payload)
@@ -186,7 +191,7 @@ async def test_checks_pass_with_existing_app_update(
     assert len(data["output"]["parameters"]) == 1
     assert data["output"]["parameters"][0][sha_key] == SUCCESS_SHA
 
-    db_app = db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
     assert db_app is not None
     assert db_app["state"][sha_key] == SUCCESS_SHA
 
@@ -206,11 +211,14 @@ async def test_cache_hit_returns_current_request_state(
     state stored in the database. The database should also not be updated.
     """
     checks_regex = PASSING_CHECKS_REGEX
-    sha_check_fingerprint = "+".join([SUCCESS_SHA, *checks_regex])
+    sha_check_fingerprint = hashlib.blake2b(
+        b"\x00".join(s.encode() for s in [SUCCESS_SHA, *checks_regex]),
+        digest_size=16,
+    ).hexdigest()
 
     # 1. Create a pre-existing application with a specific state and fingerprint
     previous_state = {"this_is": "old_state"}
-    db_service.create_application(
+    await db_service.create_application(
         APP_SET_NAME,
         REPO_NAME,
         BRANCH,
@@ -233,6 +241,6 @@ async def test_cache_hit_returns_current_request_state(
     assert data["output"]["parameters"][0] != previous_state
 
     # 5. Verify the database state has not been updated
-    db_app = db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
     assert db_app is not None
     assert db_app["state"] == previous_state
@@ -0,0 +1,312 @@
+# test_state.py
+
+import asyncio
+import sqlite3
+from collections.abc import Generator
+from contextlib import suppress
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pydantic_core import to_json
+
+import state
+from state import SQLITE_HEADER, TINYDB_IMPORTED_SUFFIX, DatabaseService
+
+APP_SET_NAME = "test-appset"
+REPO_NAME = "test-repo"
+BRANCH = "main"
+
+STATE = {"organization": "test-org", "repository": REPO_NAME, "sha": "good-sha"}
+
+
+@pytest.fixture
+def db_file(tmp_path: Path) -> str:
+    """A fixture that provides a fresh database file path."""
+    return str(tmp_path / "db.sqlite3")
+
+
+@pytest.fixture
+def db_service(db_file: str) -> Generator[DatabaseService, None, None]:
+    """A fixture that provides a database service over a fresh file."""
+    db_service = DatabaseService(db_file=db_file)
+    yield db_service
+    db_service.close()
+
+
+# --- Helper Functions ---
+
+
+def committed_states(db_file: str) -> dict[str, str]:
+    """Returns the committed state of every application by repo.
+
+    A separate connection only sees what the service has committed.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        return dict(conn.execute("SELECT repo, state FROM application"))
+    finally:
+        conn.close()
+
+
+def write_tinydb_file(path: Path, *applications: dict[str, Any]) -> None:
+    """Writes a TinyDB JSON file as earlier releases stored it."""
+    table = {str(doc_id): a for doc_id, a in enumerate(applications, start=1)}
+    path.write_bytes(to_json({"_default": {}, "application": table}, indent=4))
+
+
+def tinydb_application(state: dict[str, Any] = STATE) -> dict[str, Any]:
+    """Builds an application record of a TinyDB file."""
+    return {
+        "application_set_name": APP_SET_NAME,
+        "branch": BRANCH,
+        "last_known_good_sha": "good-sha+build",
+        "repo": REPO_NAME,
+        "state": state,
+    }
+
+
+# --- Tests ---
+
+
+@pytest.mark.asyncio
+async def test_tinydb_db_file_is_imported_in_place(tmp_path: Path) -> None:
+    """Tests that a DB_FILE still holding TinyDB JSON is converted to SQLite."""
+    db_path = tmp_path / "db.json"
+    write_tinydb_file(db_path, tinydb_application())
+
+    db_service = DatabaseService(db_file=str(db_path))
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_service.close()
+
+    assert db_app is not None
+    assert db_app["state"] == STATE
+    assert db_app["last_known_good_sha"] == "good-sha+build"
+    assert db_path.read_bytes().startswith(SQLITE_HEADER)
+    assert (tmp_path / f"db.json{TINYDB_IMPORTED_SUFFIX}").exists()
+
+
+@pytest.mark.asyncio
+async def test_default_tinydb_file_is_imported(tmp_path: Path) -> None:
+    """Tests that the TinyDB file is imported into a new SQLite database."""
+    db_path = tmp_path / "db.sqlite3"
+    tinydb_path = tmp_path / "db.json"
+    write_tinydb_file(tinydb_path, tinydb_application())
+
+    db_service = DatabaseService(db_file=str(db_path), tinydb_file=str(tinydb_path))
+    db_service.close()
+
+    # A fresh instance reads the imported application back from SQLite.
+    db_service = DatabaseService(db_file=str(db_path), tinydb_file=str(tinydb_path))
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_service.close()
+
+    assert db_app is not None
+    assert db_app["state"] == STATE
+    assert not tinydb_path.exists()
+    assert (tmp_path / f"db.json{TINYDB_IMPORTED_SUFFIX}").exists()
+
+
+@pytest.mark.asyncio
+async def test_empty_tinydb_file_is_imported(tmp_path: Path) -> None:
+    """Tests that a TinyDB file that was never written to holds no applications."""
+    db_path = tmp_path / "db.sqlite3"
+    tinydb_path = tmp_path / "db.json"
+    tinydb_path.touch()
+
+    db_service = DatabaseService(db_file=str(db_path), tinydb_file=str(tinydb_path))
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_service.close()
+
+    assert db_app is None
+    assert db_path.read_bytes().startswith(SQLITE_HEADER)
+    assert not tinydb_path.exists()
+    assert (tmp_path / f"db.json{TINYDB_IMPORTED_SUFFIX}").exists()
+
+
+@pytest.mark.asyncio
+async def test_tinydb_file_is_not_imported_into_existing_db(tmp_path: Path) -> None:
+    """Tests that an existing SQLite database is never overwritten by TinyDB."""
+    db_path = tmp_path / "db.sqlite3"
+    tinydb_path = tmp_path / "db.json"
+    newer_state = {**STATE, "sha": "newer-sha"}
+
+    db_service = DatabaseService(db_file=str(db_path))
+    await db_service.create_application(APP_SET_NAME, REPO_NAME, BRANCH, newer_state)
+    db_service.close()
+
+    write_tinydb_file(tinydb_path, tinydb_application())
+    db_service = DatabaseService(db_file=str(db_path), tinydb_file=str(tinydb_path))
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    db_service.close()
+
+    assert db_app is not None
+    assert db_app["state"] == newer_state
+    assert tinydb_path.exists()
+
+
+def test_unknown_db_file_is_rejected(tmp_path: Path) -> None:
+    """Tests that a file that is neither SQLite nor TinyDB is left untouched."""
+    db_path = tmp_path / "db.sqlite3"
+    db_path.write_text("not a database")
+
+    with pytest.raises(Exception, match="neither a SQLite database nor a valid TinyDB"):
+        DatabaseService(db_file=str(db_path))
+
+    assert db_path.read_text() == "not a database"
+
+
+@pytest.mark.parametrize("in_place", [True, False])
+def test_malformed_tinydb_file_is_left_untouched(
+    tmp_path: Path, in_place: bool
+) -> None:
+    """Tests that a failed import leaves the TinyDB file to retry on restart."""
+    tinydb_path = tmp_path / "db.json"
+    db_path = tinydb_path if in_place else tmp_path / "db.sqlite3"
+    malformed_application = tinydb_application()
+    del malformed_application["branch"]
+    write_tinydb_file(tinydb_path, tinydb_application(), malformed_application)
+    tinydb_bytes = tinydb_path.read_bytes()
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="a valid TinyDB JSON file"):
+            DatabaseService(db_file=str(db_path), tinydb_file=str(tinydb_path))
+
+    assert tinydb_path.read_bytes() == tinydb_bytes
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["db.json"]
+
+
+@pytest.mark.asyncio
+async def test_flushed_application_is_read_back(
+    db_service: DatabaseService, db_file: str
+) -> None:
+    """Tests that a flushed application is read back by a fresh instance."""
+    await db_service.create_application(
+        APP_SET_NAME, REPO_NAME, BRANCH, STATE, last_known_good_sha="fingerprint"
+    )
+    db_service.flush()
+
+    fresh_db_service = DatabaseService(db_file=db_file)
+    db_app = await fresh_db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    fresh_db_service.close()
+
+    assert db_app is not None
+    assert db_app["state"] == STATE
+    assert db_app["last_known_good_sha"] == "fingerprint"
+
+
+@pytest.mark.asyncio
+async def test_upsert_replaces_committed_application(
+    db_service: DatabaseService, db_file: str
+) -> None:
+    """Tests that upserting a committed application replaces its row."""
+    newer_state = {**STATE, "sha": "newer-sha"}
+
+    await db_service.upsert_application(APP_SET_NAME, REPO_NAME, BRANCH, STATE)
+    db_service.flush()
+    await db_service.upsert_application(APP_SET_NAME, REPO_NAME, BRANCH, newer_state)
+    db_service.flush()
+
+    assert committed_states(db_file) == {REPO_NAME: to_json(newer_state).decode()}
+
+
+@pytest.mark.asyncio
+async def test_full_write_batch_is_flushed_inline(
+    db_service: DatabaseService, db_file: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that the write filling a batch commits it without a flush call."""
+    monkeypatch.setattr(state, "WRITE_BATCH_SIZE", 3)
+
+    for repo in ["repo-1", "repo-2"]:
+        await db_service.upsert_application(APP_SET_NAME, repo, BRANCH, STATE)
+    assert committed_states(db_file) == {}
+
+    await db_service.upsert_application(APP_SET_NAME, "repo-3", BRANCH, STATE)
+    assert committed_states(db_file).keys() == {"repo-1", "repo-2", "repo-3"}
+
+
+@pytest.mark.asyncio
+async def test_writer_commits_pending_writes(
+    db_service: DatabaseService, db_file: str
+) -> None:
+    """Tests that run_writer commits pending writes within one interval."""
+    interval = 0.01
+    writer = asyncio.create_task(db_service.run_writer(interval))
+    try:
+        await db_service.upsert_application(APP_SET_NAME, REPO_NAME, BRANCH, STATE)
+        assert committed_states(db_file) == {}
+
+        await asyncio.sleep(interval * 10)
+        assert committed_states(db_file).keys() == {REPO_NAME}
+    finally:
+        writer.cancel()
+        with suppress(asyncio.CancelledError):
+            await writer
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_writes_pending(
+    db_service: DatabaseService, db_file: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a failed flush is rolled back and retried by the next one."""
+    await db_service.upsert_application(APP_SET_NAME, REPO_NAME, BRANCH, STATE)
+
+    monkeypatch.setattr(state, "UPSERT_APPLICATION_QUERY", "INSERT INTO missing")
+    with pytest.raises(sqlite3.OperationalError):
+        db_service.flush()
+    monkeypatch.undo()
+
+    db_app = await db_service.get_application(APP_SET_NAME, REPO_NAME, BRANCH)
+    assert db_app is not None
+    assert db_app["state"] == STATE
+    assert committed_states(db_file) == {}
+
+    db_service.flush()
+    assert committed_states(db_file).keys() == {REPO_NAME}
+
+
+@pytest.mark.asyncio
+async def test_application_cache_evicts_least_recently_used(
+    db_service: DatabaseService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that the cache evicts the least recently used application."""
+    monkeypatch.setattr(state, "APPLICATION_CACHE_MAXSIZE", 2)
+    for repo in ["repo-1", "repo-2", "repo-3"]:
+        await db_service.create_application(APP_SET_NAME, repo, BRANCH, STATE)
+    db_service.flush()
+    db_service._cache.clear()
+
+    await db_service.get_application(APP_SET_NAME, "repo-1", BRANCH)
+    await db_service.get_application(APP_SET_NAME, "repo-2", BRANCH)
+    # The hit makes repo-1 the most recently used, so repo-2 is evicted.
+    await db_service.get_application(APP_SET_NAME, "repo-1", BRANCH)
+    await db_service.get_application(APP_SET_NAME, "repo-3", BRANCH)
+
+    assert [key[1] for key in db_service._cache] == ["repo-1", "repo-3"]
+
+
+@pytest.mark.asyncio
+async def test_evicted_pending_application_is_read_back(
+    db_service: DatabaseService, db_file: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a pending write evicted from the cache is still read back."""
+    monkeypatch.setattr(state, "APPLICATION_CACHE_MAXSIZE", 2)
+    for repo in ["repo-1", "repo-2", "repo-3"]:
+        await db_service.upsert_application(APP_SET_NAME, repo, BRANCH, STATE)
+    assert (APP_SET_NAME, "repo-1", BRANCH) not in db_service._cache
+
+    db_app = await db_service.get_application(APP_SET_NAME, "repo-1", BRANCH)
+
+    assert db_app is not None
+    assert db_app["state"] == STATE
+    assert committed_states(db_file) == {}
+
+
+@pytest.mark.asyncio
+async def test_health_check(db_file: str) -> None:
+    """Tests that the health check fails once the database is unreachable."""
+    db_service = DatabaseService(db_file=db_file)
+    assert await db_service.health_check()
+
+    db_service.close()
+    assert not await db_service.health_check()